@@ -1,65 +1,161 @@
 import os
+import re
+import sys
+import signal
+import random
+import queue
+import asyncio
 import subprocess
+import multiprocessing
 import argparse
+import functools
+import hashlib
+import importlib.util
+import sqlite3
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from openai import OpenAI, RateLimitError, OpenAIError
-import time
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+import httpx
+from openai import (
+    AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError, OpenAIError,
+    APIConnectionError, InternalServerError,
+)
+from faster_whisper import WhisperModel
+import ctranslate2
+import numpy as np
+import tiktoken
 
 SCOPES = ['https://www.googleapis.com/auth/documents']
+TOKEN_PATH = 'token.json'
+HTTP_TIMEOUT = 30  # Seconds before a Google API request is abandoned
+
+# Google Docs limits: writes per minute per user, and what fits in one batchUpdate
+DOCS_WRITES_PER_MINUTE = 60
+DOCS_BATCH_REQUESTS = 500
+DOCS_BATCH_BYTES = 900 * 1024
+# JSON bodies are ASCII-escaped, so one character can serialize to 12 bytes (a \uXXXX\uXXXX
+# surrogate pair); 1 KB is left for the request envelope
+DOCS_INSERT_CHARS = (DOCS_BATCH_BYTES - 1024) // 12
+
+SUMMARY_MODEL = 'gpt-4o'  # You can use 'gpt-3.5-turbo' if preferred
+# Must stay byte-identical between calls: OpenAI caches prompts by their longest shared prefix
+SUMMARY_PROMPT_PREFIX = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "Create a concise, correct in grammar and punctuation summary of the text. If there are less than two sentences, just fix them according to grammar."},
+]
+SUMMARY_CHUNK_TOKENS = 3000  # Longer transcriptions are summarized piece by piece
+BATCH_POLL_SECONDS = 30
+# Client-side OpenAI limits, kept below the account's quota so requests are paced rather than rejected
+OPENAI_MAX_CONCURRENCY = 5
+OPENAI_TOKENS_PER_MINUTE = 30000
+OPENAI_TIMEOUT = 60  # Seconds before an OpenAI request is abandoned
+# Server and transport failures; only these count towards opening a circuit breaker
+OPENAI_OUTAGE_ERRORS = (APIConnectionError, InternalServerError)
+EMBEDDING_MODEL = 'text-embedding-3-small'
+EMBEDDING_MAX_TOKENS = 8191
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Cosine similarity at which a cached summary is reused
+
+WHISPER_MODEL = 'base'
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+BYTES_PER_SECOND = SAMPLE_RATE * BYTES_PER_SAMPLE
+CHUNK_SECONDS = 1  # How often the active buffer is re-decoded
+BUFFER_SECONDS = 30  # Upper bound on the audio kept in the active buffer
+# Capture in Whisper's native format (16 kHz mono S16LE) so it needs no resampling
+REC_COMMAND = [
+    'rec', '-q',
+    '-c', '1', '-r', str(SAMPLE_RATE), '-b', str(BYTES_PER_SAMPLE * 8), '-e', 'signed-integer',
+    '-t', 'raw', '-',
+    'remix', '-',
+]
+
+_CREDS_HELP = """
+Error: Google credentials file not found!
+
+To create Google credentials:
+1. Go to https://console.cloud.google.com
+2. Create a new project or select an existing one
+3. Enable Google Docs API:
+   - Go to 'APIs & Services' → 'Library'
+   - Search for 'Google Docs API'
+   - Click Enable
+4. Create credentials:
+   - Go to 'APIs & Services' → 'Credentials'
+   - Click 'Create Credentials' → 'OAuth 2.0 Client ID'
+   - Choose 'Desktop Application'
+   - Give it a name
+   - Download the JSON file
+
+Then run this script with:
+python script.py -c path/to/credentials.json -o path/to/openai_key.txt [-l language_code]
+Example: python script.py -c credentials.json -o openai_key.txt -l en
+"""
+
+_OPENAI_HELP = """
+Error: OpenAI API key file not found!
+
+To obtain an OpenAI API key:
+1. Sign up or log in to your OpenAI account at https://platform.openai.com/
+2. Navigate to the API section: https://platform.openai.com/account/api-keys
+3. Click on 'Create new secret key'
+4. Name your API key and click 'Create secret key'
+5. Copy the generated API key
+6. Save the API key to a file, for example, 'openai_key.txt'
+
+Then run this script with:
+python script.py -c path/to/credentials.json -o path/to/openai_key.txt [-l language_code]
+Example: python script.py -c credentials.json -o openai_key.txt -l en
+"""
 
 def print_credentials_instructions():
-    print("\nError: Google credentials file not found!")
-    print("\nTo create Google credentials:")
-    print("1. Go to https://console.cloud.google.com")
-    print("2. Create a new project or select an existing one")
-    print("3. Enable Google Docs API:")
-    print("   - Go to 'APIs & Services' → 'Library'")
-    print("   - Search for 'Google Docs API'")
-    print("   - Click Enable")
-    print("4. Create credentials:")
-    print("   - Go to 'APIs & Services' → 'Credentials'")
-    print("   - Click 'Create Credentials' → 'OAuth 2.0 Client ID'")
-    print("   - Choose 'Desktop Application'")
-    print("   - Give it a name")
-    print("   - Download the JSON file")
-    print("\nThen run this script with:")
-    print("python script.py -c path/to/credentials.json -o path/to/openai_key.txt [-l language_code]")
-    print("Example: python script.py -c credentials.json -o openai_key.txt -l en")
+    sys.stdout.write(_CREDS_HELP)
 
 def print_openai_key_instructions():
-    print("\nError: OpenAI API key file not found!")
-    print("\nTo obtain an OpenAI API key:")
-    print("1. Sign up or log in to your OpenAI account at https://platform.openai.com/")
-    print("2. Navigate to the API section: https://platform.openai.com/account/api-keys")
-    print("3. Click on 'Create new secret key'")
-    print("4. Name your API key and click 'Create secret key'")
-    print("5. Copy the generated API key")
-    print("6. Save the API key to a file, for example, 'openai_key.txt'")
-    print("\nThen run this script with:")
-    print("python script.py -c path/to/credentials.json -o path/to/openai_key.txt [-l language_code]")
-    print("Example: python script.py -c credentials.json -o openai_key.txt -l en")
+    sys.stdout.write(_OPENAI_HELP)
 
-def get_google_creds(credentials_path):
-    """Gets valid user credentials from storage or initiates the OAuth2 flow."""
+def load_google_creds(credentials_path):
+    """Loads stored user credentials, refreshing them if needed; returns None if the OAuth2 flow is required.
+
+    Never opens the browser, so it is safe to run in the background.
+    """
     if not os.path.exists(credentials_path):
         print_credentials_instructions()
         raise FileNotFoundError(f"Credentials file not found: {credentials_path}")
 
-    creds = None
-    token_path = 'token.json'
-    
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    if not creds or not creds.valid:
+    if not os.path.exists(TOKEN_PATH):
+        return None
+    creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+    if not creds.valid and creds.expired and creds.refresh_token:
+        try:
+            creds.refresh(Request())
+        except RefreshError:
+            return None
+        _save_google_creds(creds)
+    return creds if creds.valid else None
+
+def _save_google_creds(creds):
+    # Save credentials for future use
+    with open(TOKEN_PATH, 'w') as token:
+        token.write(creds.to_json())
+
+def get_google_creds(credentials_path):
+    """Gets valid user credentials from storage or initiates the OAuth2 flow."""
+    creds = load_google_creds(credentials_path)
+    if not creds:
         flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
         creds = flow.run_local_server(port=0)
-        # Save credentials for future use
-        with open(token_path, 'w') as token:
-            token.write(creds.to_json())
+        _save_google_creds(creds)
     return creds
 
 def get_openai_api_key(openai_key_path):
@@ -78,119 +174,680 @@ def get_openai_api_key(openai_key_path):
         print(f"Error reading OpenAI API key: {e}")
         raise
 
+@functools.lru_cache(maxsize=1)
+def _docs_service(creds):
+    """Builds the Docs client once, from the discovery document bundled with the library."""
+    # One authorized keep-alive connection carries every Docs call of the run
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build('docs', 'v1', http=http, static_discovery=True)
+
+@functools.lru_cache(maxsize=1)
+def _openai_client(api_key):
+    """Returns a shared OpenAI client so its connection pool is reused across calls."""
+    http_client = DefaultAsyncHttpxClient(
+        # HTTP/2 needs the optional h2 package; HTTP/1.1 keep-alive still reuses connections without it
+        http2=importlib.util.find_spec('h2') is not None,
+        limits=httpx.Limits(max_keepalive_connections=OPENAI_MAX_CONCURRENCY * 2),
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=OPENAI_TIMEOUT,
+        max_retries=0,  # _with_retries does the retrying, so the circuit breaker sees every failure
+    )
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+class CircuitBreaker:
+    """Fails fast after repeated outage failures, until the service has had time to recover.
+
+    State is kept in a JSON file so consecutive runs of the script share it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(_circuits_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, failures, opened_at):
+        circuits = self._load()
+        circuits[self.name] = {'failures': failures, 'opened_at': opened_at}
+        path = _circuits_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(circuits, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"Warning: Could not save {self.name} circuit breaker state: {e}")
+
+    def before_call(self):
+        """Raises CircuitOpenError while the breaker is open; after the timeout lets a trial call through."""
+        with self.lock:
+            state = self._load().get(self.name, {})
+            failures, opened_at = state.get('failures', 0), state.get('opened_at')
+            if opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.time() - opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"{self.name} failed {failures} times in a row; not retrying for another {remaining:.0f} seconds"
+                )
+            # Half-open: one more failure reopens the circuit straight away
+            self._update(self.failure_threshold - 1, None)
+
+    def record_success(self):
+        with self.lock:
+            if self._load().get(self.name):
+                self._update(0, None)
+
+    def record_failure(self):
+        with self.lock:
+            failures = self._load().get(self.name, {}).get('failures', 0) + 1
+            self._update(failures, time.time() if failures >= self.failure_threshold else None)
+
+def _cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache_home, 'transcribe_to_gdocs')
+
+def _circuits_path():
+    return os.path.join(_cache_dir(), 'circuits.json')
+
+_docs_breaker = CircuitBreaker('Google Docs')
+_openai_breaker = CircuitBreaker('OpenAI')
+
+class RateLimiter:
+    """Token bucket that paces calls against a per-minute quota."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.refill_rate = per_minute / 60
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self, cost):
+        """Takes `cost` tokens and returns how long to wait until they are covered."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+            self.updated = now
+            self.tokens -= cost
+            return max(0.0, -self.tokens / self.refill_rate)
+
+    def acquire(self, cost=1):
+        time.sleep(self._reserve(cost))
+
+    async def wait(self, cost=1):
+        await asyncio.sleep(self._reserve(cost))
+
+_docs_writes = RateLimiter(DOCS_WRITES_PER_MINUTE)
+_openai_tokens = RateLimiter(OPENAI_TOKENS_PER_MINUTE)
+
+def _doc_requests(content):
+    """Builds every edit for a new document, splitting long text into bounded inserts."""
+    return [
+        {'insertText': {'endOfSegmentLocation': {}, 'text': content[i:i + DOCS_INSERT_CHARS]}}
+        for i in range(0, len(content), DOCS_INSERT_CHARS)
+    ]
+
+def _batch_requests(requests):
+    """Packs requests into as few batchUpdate calls as the size limits allow."""
+    batch, batch_bytes = [], 0
+    for request in requests:
+        size = len(json.dumps(request).encode('utf-8'))
+        if batch and (len(batch) >= DOCS_BATCH_REQUESTS or batch_bytes + size > DOCS_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(request)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+def prepare_docs(credentials_path):
+    """Loads stored Google credentials and builds the Docs client so both are ready before the upload.
+
+    Returns None when the user still has to sign in through the browser.
+    """
+    creds = load_google_creds(credentials_path)
+    if creds:
+        _docs_service(creds)
+    return creds
+
 def create_doc(creds, title, content):
     """Creates a new Google Doc with given title and content."""
     try:
-        service = build('docs', 'v1', credentials=creds)
-        doc = service.documents().create(body={'title': title}).execute()
+        _docs_breaker.before_call()
+    except CircuitOpenError as error:
+        print(f"Skipping the upload: {error}")
+        return None
+
+    try:
+        service = _docs_service(creds)
+        # Documents can only be created empty, so all edits follow in batchUpdate calls
+        _docs_writes.acquire()
+        doc = service.documents().create(body={'title': title}, fields='documentId').execute()
         doc_id = doc.get('documentId')
-        
-        requests = [{'insertText': {'location': {'index': 1}, 'text': content}}]
-        service.documents().batchUpdate(documentId=doc_id, body={'requests': requests}).execute()
-        
+
+        for requests in _batch_requests(_doc_requests(content)):
+            _docs_writes.acquire()
+            service.documents().batchUpdate(documentId=doc_id, body={'requests': requests}).execute()
+
+        _docs_breaker.record_success()
         return f"https://docs.google.com/document/d/{doc_id}/edit"
     except HttpError as error:
+        if error.resp.status >= 500:
+            _docs_breaker.record_failure()
         print(f"An error occurred while creating the document: {error}")
         return None
+    except (OSError, httplib2.HttpLib2Error):
+        # Connection failures and timeouts
+        _docs_breaker.record_failure()
+        raise
+
+class HypothesisBuffer:
+    """Commits streamed words once two consecutive hypotheses agree on them (LocalAgreement-2)."""
+
+    def __init__(self):
+        self.committed = []
+        self.pending = []
+
+    @property
+    def committed_until(self):
+        return self.committed[-1][1] if self.committed else 0.0
+
+    def prompt(self, offset):
+        """Returns the tail of the committed text already cut from the buffer, to use as decoding context.
+
+        Words still in the buffer are left out, or Whisper would be told the audio starts with
+        text it is about to hear again.
+        """
+        return "".join(word for _, end, word in self.committed if end <= offset)[-200:] or None
+
+    def update(self, words):
+        """Commits the longest prefix of words shared with the previous hypothesis."""
+        words = [w for w in words if w[0] >= self.committed_until - 0.1]
+        # Drop words that re-transcribe the tail of what is already committed
+        if words and words[0][0] - self.committed_until < 1:
+            for n in range(min(5, len(words), len(self.committed)), 0, -1):
+                if _normalize(self.committed[-n:]) == _normalize(words[:n]):
+                    words = words[n:]
+                    break
+
+        agreed = 0
+        for new, old in zip(words, self.pending):
+            if _normalize([new]) != _normalize([old]):
+                break
+            agreed += 1
+        self.committed.extend(words[:agreed])
+        self.pending = words[agreed:]
 
-def record_and_transcribe(filename="recording.wav", language=None):
-    """Records audio and transcribes it using Whisper."""
-    print("Recording... Press Ctrl+C to stop")
+    def flush(self):
+        """Commits whatever is still pending once the stream has ended."""
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def text(self):
+        return "".join(word for _, _, word in self.committed).strip()
+
+def _normalize(words):
+    return [word.strip().lower() for _, _, word in words]
+
+def _decode(model, pcm, offset, language, prompt):
+    """Transcribes the active buffer and returns (start, end, word) tuples in stream time."""
+    # Pipe reads can split a sample; drop the trailing odd byte until the rest of it arrives
+    pcm = pcm[:len(pcm) - len(pcm) % BYTES_PER_SAMPLE]
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    segments, _ = model.transcribe(
+        samples,
+        language=language,
+        initial_prompt=prompt,
+        vad_filter=True,
+        word_timestamps=True,
+    )
+    return [(offset + w.start, offset + w.end, w.word) for s in segments for w in s.words]
+
+def _trim_buffer(audio, offset, committed_until):
+    """Keeps the active buffer within BUFFER_SECONDS, cutting at the last committed word when possible."""
+    duration = len(audio) / BYTES_PER_SECOND
+    if duration <= BUFFER_SECONDS:
+        return offset
+    cut = max(committed_until - offset, duration - BUFFER_SECONDS)
+    cut_bytes = int(cut * SAMPLE_RATE) * BYTES_PER_SAMPLE
+    del audio[:cut_bytes]
+    return offset + cut_bytes / BYTES_PER_SECOND
+
+def _whisper_compute_type():
+    """Picks quantized weights: INT8 on CPU, INT8 weights with FP16 activations on CUDA."""
+    return 'int8_float16' if ctranslate2.get_cuda_device_count() > 0 else 'int8'
+
+def _whisper_worker(requests, results):
+    """Loads the Whisper model once and decodes audio buffers until told to stop."""
+    # Ctrl+C is meant for the recorder; the parent shuts the worker down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     try:
-        subprocess.run(['rec', '-r', '44100', filename], check=True)
-    except KeyboardInterrupt:
-        print("\nRecording stopped")
+        model = WhisperModel(WHISPER_MODEL, device='auto', compute_type=_whisper_compute_type())
+        for job in iter(requests.get, None):
+            results.put(_decode(model, *job))
+    except Exception as e:
+        results.put(e)
+
+class WhisperWorker:
+    """Keeps a Whisper model resident in a child process for the lifetime of the script."""
+
+    def __init__(self):
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=_whisper_worker, args=(self.requests, self.results), daemon=True
+        )
+        # Spawned workers re-import this module before _whisper_worker runs; ignoring SIGINT
+        # across start() means a Ctrl+C during that import can't kill the worker
+        previous_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            self.process.start()
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+
+    def transcribe(self, pcm, offset=0.0, language=None, prompt=None):
+        """Sends raw PCM to the worker and waits for the decoded words."""
+        self.requests.put((pcm, offset, language, prompt))
+        while True:
+            try:
+                result = self.results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("Whisper worker exited unexpectedly")
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """Stops the worker so the model's memory (including GPU memory) is released."""
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+
+async def _read_audio(stdout, audio):
+    """Appends raw PCM from the recorder to the active buffer until it stops."""
+    while chunk := await stdout.read(BYTES_PER_SECOND):
+        audio.extend(chunk)
+
+def _stop_recording(proc, state):
+    print("\nRecording stopped")
+    state['stopped'] = True
+    if proc.returncode is None:
+        try:
+            proc.terminate()
+        except ProcessLookupError:
+            pass
+
+async def _stream_transcribe(whisper, language):
+    """Pipes the recorder into Whisper, decoding the active buffer every CHUNK_SECONDS."""
+    proc = await asyncio.create_subprocess_exec(*REC_COMMAND, stdout=asyncio.subprocess.PIPE)
+    loop = asyncio.get_running_loop()
+    state = {'stopped': False}
+    loop.add_signal_handler(signal.SIGINT, _stop_recording, proc, state)
+
+    audio = bytearray()
+    offset = 0.0  # Stream time, in seconds, of the first sample in `audio`
+    hypothesis = HypothesisBuffer()
+    reader = asyncio.create_task(_read_audio(proc.stdout, audio))
+    try:
+        while not reader.done():
+            await asyncio.wait({reader}, timeout=CHUNK_SECONDS)
+            if reader.done() or not audio:
+                continue
+            words = await asyncio.to_thread(whisper.transcribe, bytes(audio), offset, language, hypothesis.prompt(offset))
+            hypothesis.update(words)
+            offset = _trim_buffer(audio, offset, hypothesis.committed_until)
+        await reader
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
+        if not reader.done():
+            reader.cancel()
+            proc.terminate()
+
+    returncode = await proc.wait()
+    if returncode != 0 and not state['stopped']:
+        print(f"\nError during recording: rec exited with status {returncode}")
+        raise subprocess.CalledProcessError(returncode, REC_COMMAND)
+
+    if audio:
+        words = await asyncio.to_thread(whisper.transcribe, bytes(audio), offset, language, hypothesis.prompt(offset))
+        hypothesis.update(words)
+    hypothesis.flush()
+    return hypothesis.text()
+
+async def record_and_transcribe(whisper, language=None):
+    """Records audio and transcribes it with Whisper while the recording is in progress."""
+    if language:
+        print(f"Specified language: {language}")
+    else:
+        print("No language specified. Whisper will auto-detect the language based on the first part of the audio.")
+
+    print("Recording and transcribing... Press Ctrl+C to stop")
+    try:
+        return await _stream_transcribe(whisper, language)
     except FileNotFoundError:
         print("\nError: 'rec' command not found. Please install 'sox' to enable recording.")
         raise
-    except subprocess.CalledProcessError as e:
-        print(f"\nError during recording: {e}")
-        raise
-    
-    print("Transcribing with Whisper...")
+
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def _parse_duration(value):
+    """Parses OpenAI reset durations such as '1s', '250ms' or '6m0s' into seconds."""
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def _retry_after(error):
+    """Returns the wait, in seconds, that the server asked for in a rate limit response."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    if 'retry-after-ms' in headers:
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    if 'retry-after' in headers:
+        try:
+            return float(headers['retry-after'])
+        except ValueError:
+            pass
+    for header in ('x-ratelimit-reset-tokens', 'x-ratelimit-reset-requests'):
+        if header in headers:
+            wait_time = _parse_duration(headers[header])
+            if wait_time is not None:
+                return wait_time
+    return None
+
+class SummaryCache:
+    """Append-only SQLite cache of summaries, matched by exact hash or by embedding similarity."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS summaries '
+            '(sha256 TEXT PRIMARY KEY, embedding BLOB, summary TEXT NOT NULL, config TEXT)'
+        )
+        # Caches created before summaries were tied to a model and prompt lack the column;
+        # their rows keep a NULL config and are never matched again
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(summaries)')]
+        if 'config' not in columns:
+            with self.conn:
+                self.conn.execute('ALTER TABLE summaries ADD COLUMN config TEXT')
+
+    def get(self, sha256):
+        row = self.conn.execute('SELECT summary FROM summaries WHERE sha256 = ?', (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def nearest(self, config, embedding, threshold):
+        """Returns the summary made with `config` whose text embedding is most similar, if it clears the threshold."""
+        best, best_score = None, threshold
+        rows = self.conn.execute(
+            'SELECT embedding, summary FROM summaries WHERE embedding IS NOT NULL AND config = ?', (config,)
+        )
+        for blob, summary in rows:
+            other = np.frombuffer(blob, dtype=np.float32)
+            if other.shape != embedding.shape:
+                continue
+            score = float(np.dot(embedding, other) / (np.linalg.norm(embedding) * np.linalg.norm(other)))
+            if score >= best_score:
+                best, best_score = summary, score
+        return best
+
+    def put(self, sha256, config, embedding, summary):
+        blob = None if embedding is None else embedding.tobytes()
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO summaries (sha256, embedding, summary, config) VALUES (?, ?, ?, ?)',
+                (sha256, blob, summary, config),
+            )
+
+@functools.lru_cache(maxsize=1)
+def _summary_cache():
+    return SummaryCache(os.path.join(_cache_dir(), 'summaries.sqlite'))
+
+async def _embed(client, text):
+    """Embeds text for the semantic cache; returns None if the embedding cannot be fetched."""
+    if not text.strip():
+        return None
     try:
-        whisper_command = [
-            'whisper', 
-            filename, 
-            '--model', 'base',
-            '--output_dir', '.', 
-            '--output_format', 'txt'
-        ]
-        if language:
-            whisper_command.extend(['--language', language])
-            print(f"Specified language: {language}")
-        else:
-            print("No language specified. Whisper will auto-detect the language based on the first part of the audio.")
-        
-        subprocess.run(whisper_command, check=True)
-        
-        # Look for the transcription file
-        base_filename = os.path.splitext(filename)[0]
-        transcription_file = f"{base_filename}.txt"
-        print(f"Looking for transcription in: {transcription_file}")
-        
-        if os.path.exists(transcription_file):
-            with open(transcription_file, 'r') as f:
-                transcription = f.read()
-            return transcription
-        else:
-            print("Available txt files:", [f for f in os.listdir('.') if f.endswith('.txt')])
-            raise FileNotFoundError(f"Could not find transcription file: {transcription_file}")
-            
-    except subprocess.CalledProcessError as e:
-        print(f"Error running Whisper: {e}")
-        raise
+        _openai_breaker.before_call()
+        # The model rejects longer inputs; the opening of a transcription is enough to spot a retake
+        tokens = _encoding(EMBEDDING_MODEL).encode(text)[:EMBEDDING_MAX_TOKENS]
+        response = await client.embeddings.create(model=EMBEDDING_MODEL, input=tokens)
+    except OpenAIError as e:
+        if isinstance(e, OPENAI_OUTAGE_ERRORS):
+            _openai_breaker.record_failure()
+        print(f"Warning: Could not embed text for the summary cache: {e}")
+        return None
+    except CircuitOpenError as e:
+        print(f"Warning: Skipping the summary cache lookup: {e}")
+        return None
+    _openai_breaker.record_success()
+    return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+@functools.lru_cache(maxsize=1)
+def _openai_slots():
+    """Caps concurrent OpenAI requests; created lazily so it binds to the running event loop."""
+    return asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model=SUMMARY_MODEL):
+    return tiktoken.encoding_for_model(model)
+
+def _request_tokens(request):
+    """Estimates what a chat request counts against the TPM limit, including its max_tokens."""
+    prompt_tokens = sum(len(_encoding().encode(m['content'])) + 4 for m in request['messages'])
+    return prompt_tokens + request['max_tokens']
+
+def _summary_request(text):
+    """Builds the chat completion body, with the static prefix first so OpenAI's prompt cache can reuse it."""
+    return {
+        'model': SUMMARY_MODEL,
+        'messages': SUMMARY_PROMPT_PREFIX + [{"role": "user", "content": text}],
+        'max_tokens': 500,  # Adjust as needed
+        'temperature': 0.5,
+    }
 
-def summarize_text(text, api_key, max_retries=5, backoff_factor=2):
-    """Generates a summary of the given text using OpenAI's ChatCompletion API with retry logic."""
+def _summary_config():
+    """Fingerprints everything besides the text that shapes a summary, so cached ones go stale with it."""
+    settings = _summary_request('')
+    settings['chunk_tokens'] = SUMMARY_CHUNK_TOKENS
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _split_text(text, max_tokens):
+    """Yields pieces of at most max_tokens tokens, breaking between sentences where possible."""
+    encoding = _encoding()
+    chunk, chunk_tokens = [], 0
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        tokens = encoding.encode(sentence)
+        if chunk and chunk_tokens + len(tokens) > max_tokens:
+            yield " ".join(chunk)
+            chunk, chunk_tokens = [], 0
+        # A single sentence longer than a whole chunk is cut at token boundaries
+        while len(tokens) > max_tokens:
+            yield encoding.decode(tokens[:max_tokens])
+            tokens = tokens[max_tokens:]
+            sentence = encoding.decode(tokens)
+        chunk.append(sentence)
+        chunk_tokens += len(tokens)
+    if chunk:
+        yield " ".join(chunk)
+
+async def _chat_completion(client, request):
+    """Runs one real-time chat completion within the concurrency and TPM limits."""
+    async with _openai_slots():
+        await _openai_tokens.wait(_request_tokens(request))
+        completion = await client.chat.completions.create(**request)
+    return completion.choices[0].message.content
+
+async def _batch_completions(client, requests, poll_interval=BATCH_POLL_SECONDS, **retry):
+    """Runs chat completions through the Batch API and waits for their results, in order.
+
+    Each API call is retried on its own, so a rate-limited poll never resubmits the job.
+    """
+    lines = [
+        json.dumps({'custom_id': str(i), 'method': 'POST', 'url': '/v1/chat/completions', 'body': request})
+        for i, request in enumerate(requests)
+    ]
+    batch_input = await _with_retries(lambda: client.files.create(
+        file=('summary.jsonl', "\n".join(lines).encode('utf-8')),
+        purpose='batch',
+    ), **retry)
+    batch = await _with_retries(lambda: client.batches.create(
+        input_file_id=batch_input.id,
+        endpoint='/v1/chat/completions',
+        completion_window='24h',
+    ), **retry)
+    print(f"Submitted batch {batch.id}. Waiting for it to complete (this can take a while)...")
     try:
-        client = OpenAI(api_key=api_key)
-        
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": "Create a concise, correct in grammar and punctuation summary of the text. If there are less than two sentences, just fix them according to grammar."},
-            {"role": "user", "content": text}
-        ]
-        
-        completion = client.chat.completions.create(
-            model='gpt-4o',  # You can use 'gpt-3.5-turbo' if preferred
-            messages=messages,
-            max_tokens=500,  # Adjust as needed
-            temperature=0.5,
-        )
-        
-        summary = completion.choices[0].message.content
-        return summary
-    
-    except RateLimitError as e:
-        if max_retries > 0:
-            wait_time = backoff_factor * (6 - max_retries)  # Exponential backoff
-            print(f"Rate limit exceeded. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
-            return summarize_text(text, api_key, max_retries - 1, backoff_factor)
-        else:
-            print("Max retries exceeded. Please check your OpenAI quota and billing details.")
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            await asyncio.sleep(poll_interval)
+            batch = await _with_retries(functools.partial(client.batches.retrieve, batch.id), **retry)
+    except (asyncio.CancelledError, KeyboardInterrupt, OpenAIError, CircuitOpenError):
+        # Don't leave an abandoned job running (and billed) on OpenAI's side
+        print(f"Cancelling batch {batch.id}...")
+        try:
+            await client.batches.cancel(batch.id)
+        except OpenAIError as e:
+            print(f"Warning: Could not cancel batch {batch.id}: {e}")
+        raise
+
+    if batch.status != 'completed' or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} did not produce a summary (status: {batch.status})")
+    output = await _with_retries(functools.partial(client.files.content, batch.output_file_id), **retry)
+    results = {}
+    for line in output.text.splitlines():
+        result = json.loads(line)
+        if result.get('error'):
+            raise RuntimeError(f"Batch {batch.id} failed: {result['error']}")
+        results[result['custom_id']] = result['response']['body']['choices'][0]['message']['content']
+    if len(results) != len(requests):
+        raise RuntimeError(f"Batch {batch.id} returned {len(results)} of {len(requests)} summaries")
+    return [results[str(i)] for i in range(len(requests))]
+
+async def _with_retries(call, max_retries=5, backoff_factor=2, max_delay=60):
+    """Awaits call(), retrying rate limits and outages with backoff and tracking the circuit breaker."""
+    for attempt in range(max_retries + 1):
+        _openai_breaker.before_call()
+        try:
+            result = await call()
+            _openai_breaker.record_success()
+            return result
+
+        except (RateLimitError,) + OPENAI_OUTAGE_ERRORS as e:
+            rate_limited = isinstance(e, RateLimitError)
+            if not rate_limited:
+                _openai_breaker.record_failure()
+            if attempt == max_retries:
+                if rate_limited:
+                    print("Max retries exceeded. Please check your OpenAI quota and billing details.")
+                else:
+                    print(f"Max retries exceeded. OpenAI appears to be unavailable: {e}")
+                raise e
+            wait_time = _retry_after(e)
+            if wait_time is None:
+                # Exponential backoff with jitter so concurrent clients don't retry in lockstep
+                wait_time = min(max_delay, backoff_factor * 2 ** attempt) * (1 - random.random() * 0.75)
+            reason = "Rate limit exceeded" if rate_limited else f"OpenAI request failed ({e})"
+            print(f"{reason}. Retrying in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+
+        except OpenAIError as e:
+            print(f"An OpenAI API error occurred: {e}")
             raise e
-    
-    except OpenAIError as e:
-        print(f"An OpenAI API error occurred: {e}")
-        raise e
-    
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        raise e
 
-def cleanup_files(*filenames):
-    """Cleans up temporary files."""
-    for filename in filenames:
-        if filename and os.path.exists(filename):
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            raise e
+
+async def _summarize_all(client, texts, batch=False, **retry):
+    """Summarizes each text, in one batch job or as concurrent real-time requests."""
+    requests = [_summary_request(text) for text in texts]
+    if batch:
+        return await _batch_completions(client, requests, **retry)
+    tasks = [
+        asyncio.ensure_future(_with_retries(functools.partial(_chat_completion, client, request), **retry))
+        for request in requests
+    ]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        # gather() leaves the other requests (and their retries) running when one fails
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def summarize_text(text, api_key, max_retries=5, backoff_factor=2, max_delay=60, use_cache=True, batch=False):
+    """Generates a summary of the given text using OpenAI's ChatCompletion API with retry logic.
+
+    Long texts are summarized in SUMMARY_CHUNK_TOKENS pieces, and the partial summaries are
+    combined the same way until they fit in one request.
+    """
+    client = _openai_client(api_key)
+
+    cache = None
+    if use_cache:
+        config = _summary_config()
+        text_hash = hashlib.sha256(f"{config}\n{text}".encode('utf-8')).hexdigest()
+        try:
+            cache = _summary_cache()
+            summary = cache.get(text_hash)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Summary cache unavailable, summarizing without it: {e}")
+            cache, summary = None, None
+        if summary is not None:
+            print("Using cached summary (exact match)")
+            return summary
+
+    if cache is not None:
+        embedding = await _embed(client, text)
+        if embedding is not None:
             try:
-                os.remove(filename)
-                print(f"Cleaned up {filename}")
-            except Exception as e:
-                print(f"Warning: Could not remove {filename}: {e}")
+                summary = cache.nearest(config, embedding, SEMANTIC_CACHE_THRESHOLD)
+            except sqlite3.Error as e:
+                print(f"Warning: Could not search the summary cache: {e}")
+            if summary is not None:
+                print("Using cached summary (similar transcription)")
+                return summary
+
+    retry = {'max_retries': max_retries, 'backoff_factor': backoff_factor, 'max_delay': max_delay}
+    chunks = list(_split_text(text, SUMMARY_CHUNK_TOKENS))
+    # Keep condensing until the partial summaries fit in a single bounded request
+    while len(chunks) > 1:
+        print(f"Long text: summarizing {len(chunks)} parts, then combining them...")
+        partial_summaries = await _summarize_all(client, chunks, batch=batch, **retry)
+        chunks = list(_split_text("\n\n".join(partial_summaries), SUMMARY_CHUNK_TOKENS))
+    [summary] = await _summarize_all(client, chunks, batch=batch, **retry)
 
-def main():
+    if cache is not None:
+        try:
+            cache.put(text_hash, config, embedding, summary)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not save the summary to the cache: {e}")
+    return summary
+
+async def main():
     parser = argparse.ArgumentParser(description='Record audio, transcribe, summarize, and upload to Google Docs')
     parser.add_argument('-c', '--credentials', 
                         help='Path to the Google OAuth credentials JSON file',
@@ -201,38 +858,61 @@ def main():
     parser.add_argument('-l', '--language',
                         help='Language code for transcription (e.g., en, es). If not specified, language will be auto-detected.',
                         default=None)
+    parser.add_argument('--no-cache',
+                        help='Always request a fresh summary instead of reusing one from the local cache',
+                        action='store_true')
+    parser.add_argument('--batch',
+                        help='Summarize through the OpenAI Batch API: about half the cost, but can take up to 24 hours',
+                        action='store_true')
     args = parser.parse_args()
 
+    try:
+        # Read the key and set up the client up front so problems are reported before anything is recorded
+        openai_api_key = get_openai_api_key(args.openai_key_file)
+        _openai_client(openai_api_key)
+    except (OSError, ValueError):
+        # Instructions or the error were already printed by get_openai_api_key
+        return
+
+    # Load Whisper in the background while the rest of the script gets going
+    whisper = WhisperWorker()
+
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"recording_{timestamp}.wav"
     transcription_file = f"transcription_{timestamp}.txt"
     summary_file = f"summary_{timestamp}.txt"
     
+    # Local backups are written in the background so disk flushes stay off the critical path
+    io_pool = ThreadPoolExecutor(max_workers=2)
+    backups = []
+
+    # Load or refresh stored Google credentials and build the Docs client while recording.
+    # The browser sign-in, which can block indefinitely, only happens after a successful summary.
+    creds_task = asyncio.create_task(asyncio.to_thread(prepare_docs, args.credentials))
+    creds_awaited = False
+
     try:
         print("\n=== Starting Recording and Transcription ===")
-        transcription = record_and_transcribe(filename, language=args.language)
+        transcription = await record_and_transcribe(whisper, language=args.language)
         
         # Save local backup of transcription
-        with open(transcription_file, 'w') as f:
-            f.write(transcription)
-        print(f"\nLocal transcription backup saved to: {transcription_file}")
+        backups.append(('transcription', transcription_file, io_pool.submit(Path(transcription_file).write_text, transcription)))
         
         print("\n=== Generating Summary ===")
-        openai_api_key = get_openai_api_key(args.openai_key_file)
-        summary = summarize_text(transcription, openai_api_key)
+        summary = await summarize_text(transcription, openai_api_key, use_cache=not args.no_cache, batch=args.batch)
         
         # Save local backup of summary
-        with open(summary_file, 'w') as f:
-            f.write(summary)
-        print(f"Local summary backup saved to: {summary_file}")
+        backups.append(('summary', summary_file, io_pool.submit(Path(summary_file).write_text, summary)))
         
         print("\n=== Uploading Summary to Google Docs ===")
-        print("Getting Google credentials (browser will open for authentication)...")
-        creds = get_google_creds(args.credentials)
+        creds_awaited = True
+        creds = await creds_task
+        if not creds:
+            print("Getting Google credentials (browser will open for authentication)...")
+            creds = get_google_creds(args.credentials)
         
         doc_title = f"Summary {timestamp}"
         print(f"Creating Google Doc: {doc_title}")
-        doc_url = create_doc(creds, doc_title, summary)
+        doc_url = await asyncio.to_thread(create_doc, creds, doc_title, summary)
         
         if doc_url:
             print(f"\nSuccess! Document available at: {doc_url}")
@@ -241,15 +921,14 @@ def main():
         if "Credentials file not found" in str(e):
             # Instructions already printed by get_google_creds
             return
-        elif "OpenAI API key file not found" in str(e):
-            # Instructions already printed by get_openai_api_key
-            return
         else:
             print(f"\nError: {str(e)}")
     except KeyboardInterrupt:
         print("\nProcess interrupted by user")
     except RateLimitError as e:
         print("\nError: Rate limit exceeded. Please check your OpenAI quota and billing details.")
+    except CircuitOpenError as e:
+        print(f"\nError: {e}")
     except OpenAIError as e:
         print(f"\nAn OpenAI API error occurred: {e}")
     except Exception as e:
@@ -258,15 +937,27 @@ def main():
         import traceback
         print(traceback.format_exc())
     finally:
-        # Cleanup temporary files but keep the local backups
+        # Release the Whisper worker and pending auth, but keep the local backups
         print("\n=== Cleaning Up ===")
-        cleanup_files(
-            filename,
-            f"{os.path.splitext(filename)[0]}.txt"
-        )
-        print(f"\nLocal transcription backup kept at: {transcription_file}")
-        print(f"Local summary backup kept at: {summary_file}")
+        if not creds_task.done():
+            creds_task.cancel()
+        elif not creds_awaited and not creds_task.cancelled() and creds_task.exception():
+            error = creds_task.exception()
+            if not isinstance(error, FileNotFoundError):  # Instructions were already printed
+                print(f"Warning: Could not load Google credentials: {error}")
+        whisper.close()
+        # Make sure the backups are on disk before the script exits
+        for label, path, backup in backups:
+            try:
+                backup.result()
+                print(f"Local {label} backup saved to: {path}")
+            except Exception as e:
+                print(f"Warning: Could not save local {label} backup to {path}: {e}")
+        io_pool.shutdown()
 
 if __name__ == '__main__':
     print("=== Audio Recording, Transcription, Summary, and Upload Script ===")
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nProcess interrupted by user")